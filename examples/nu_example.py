@@ -18,8 +18,8 @@ par = nu.load_by_product(dpid='DP1.00024.001', site='RMNP',
 
 # download CHM tiles covering the veg structure plots at WREF
 pppy = veg['vst_perplotperyear']
-east = pppy['easting'].to_list()
-north = pppy['northing'].to_list()
+east = pppy['easting'].to_numpy()
+north = pppy['northing'].to_numpy()
 
 nu.by_tile_aop(dpid='DP3.30015.001', site='WREF', year=2023, 
                easting=east, northing=north, buffer=20, 
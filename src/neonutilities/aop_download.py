@@ -17,26 +17,48 @@ written by:
 
 """
 
-from time import sleep
+from time import monotonic, sleep
+from functools import lru_cache
+import csv
 import os
 import re
 import platform
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import requests
 import importlib
 import importlib_resources
 from . import __resources__
 from .helper_mods.api_helpers import get_api
+from .helper_mods.api_helpers import get_api_many
+from .helper_mods.api_helpers import parse_json
 from .helper_mods.api_helpers import download_file
+from .helper_mods.api_helpers import api_cache_max_age
+from .helper_mods.metadata_helpers import convert_byte_size
 from .get_issue_log import get_issue_log
 from .citation import get_citation
 
 # display the log info messages, only showing the message (otherwise it would print INFO:root:'message')
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
+# regular expressions for validating inputs, compiled once
+dpid_pattern = re.compile(r"DP[1-4]\.[0-9]{5}\.00[1-2]")
+aop_dpid_pattern = re.compile(r"DP[1-3]\.300[0-2][0-9]\.00[1-2]")
+site_pattern = re.compile(r"[A-Z]{4}")
+year_pattern = re.compile(r"20[1-9][0-9]")
+
+# the UTM "easting_northing" of the lower left corner of an AOP tile, as it
+# appears in the file names, e.g. NEON_D02_SCBI_DP3_741000_4301000_CHM.tif
+tile_pattern = re.compile(r"(?<![0-9])([0-9]{6}_[0-9]{7})(?![0-9])")
+
+# the same coordinates, as separate easting and northing groups
+utm_pattern = re.compile(r"([0-9]{6})_([0-9]{7})")
+
 
 # check that token was used
 def check_token(response):
@@ -63,63 +85,69 @@ def check_token(response):
             'API token was not recognized. Public rate limit applied.\n')
 
 
-def convert_byte_size(size_bytes):
-    """
-    This function converts the file size in bytes to a more readable format.
-    It converts bytes to Kilobytes (KB), Megabytes (MB), Gigabytes (GB), or Terabytes (TB)
-    depending on the size of the input.
-
-    Parameters
-    --------
-    size_bytes: int or float
-        The file size in bytes. It should be a non-negative number.
+# %%
 
-    Returns
-    --------
-    str
-        A string that represents the file size in a more readable format.
-        The format includes the size number followed by the size unit (KB, MB, GB, or TB).
 
-    Raises
-    --------
-    None
+class TimedCache:
+    """
+    Small thread-safe cache of recent results, so they can be reused within
+    a session. Entries expire max_age seconds after they are stored, and at
+    most max_size entries are kept: when an entry is stored, expired
+    entries are removed, then the oldest ones if there are still too many.
 
-    Examples
+    Parameters
     --------
-    >>> convert_byte_size(5000)
-    '5.0 KB'
-
-    >>> convert_byte_size(2000000)
-    '2.0 MB'
-
-    >>> convert_byte_size(3000000000)
-    '3.0 GB'
-
-    >>> convert_byte_size(4000000000000)
-    '4.0 TB'
-"""
-    if 10**3 < size_bytes < 10**6:
-        size_kb = round(size_bytes/(10**3), 2)
-        size_read = f'{size_kb} KB'
-    elif 10**6 < size_bytes < 10**9:
-        size_mb = round(size_bytes/(10**6), 1)
-        size_read = f'{size_mb} MB'
-        # print('Download size:', size_read)
-    elif 10**9 < size_bytes < 10**12:
-        size_gb = round(size_bytes/(10**9), 1)
-        size_read = f'{size_gb} GB'
-        # print('Download size:', size_read)
-    else:
-        size_tb = round(size_bytes/(10**12), 1)
-        size_read = f'{size_tb} TB'
-        # print('Download size:', size_read)
-    return size_read
-
-
-# %%
+    max_age: Number of seconds an entry is reused for.
+    max_size: Maximum number of entries kept. Defaults to 32.
 
+    """
 
-def get_file_urls(urls, token=None):
+    def __init__(self, max_age, max_size=32):
+        self.max_age = max_age
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value stored for key, or None if there isn't one or it
+        has expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored, value = entry
+            if monotonic() - stored >= self.max_age:
+                del self.entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        """
+        Store value for key, and remove expired and excess entries.
+        """
+        with self.lock:
+            now = monotonic()
+            self.entries.pop(key, None)
+            self.entries[key] = (now, value)
+            # entries are kept in the order they were stored, so the expired
+            # ones and the oldest ones are at the start
+            while len(self.entries) > 1:
+                oldest, (stored, _) = next(iter(self.entries.items()))
+                if now - stored < self.max_age \
+                        and len(self.entries) <= self.max_size:
+                    break
+                del self.entries[oldest]
+
+
+# file tables from get_file_urls, by month urls and token. They are reused
+# for as long as the API responses are cached on disk (10 minutes), before
+# the API is queried again.
+file_url_tables = TimedCache(max_age=api_cache_max_age)
+
+
+def get_file_urls(urls, token=None, include_provisional=True):
     """
     This function retrieves all the files from a list of NEON data URLs.
 
@@ -131,6 +159,9 @@ def get_file_urls(urls, token=None):
     token: str, optional
         User-specific API token generated within neon.datascience user accounts. If provided, it will be used for authentication.
 
+    include_provisional: bool, optional
+        Should the files of provisional months be included? Defaults to True. If False, the files of provisional months are left out, but PROVISIONAL is still listed in the releases returned.
+
     Returns
     --------
     all_file_url_df: pandas.DataFrame
@@ -156,36 +187,92 @@ def get_file_urls(urls, token=None):
     The function makes API calls to each URL in the 'urls' list and retrieves the file information.
     It also retrieves the release information from the response JSON.
     If the API call fails, it prints a warning message and continues with the next URL.
+    If all the calls succeed, the results are reused for 10 minutes, so repeated downloads from the same site and year don't query the API again.
     """
 
-    all_file_url_df = pd.DataFrame()
+    key = (tuple(urls), token, include_provisional)
+    cached = file_url_tables.get(key)
+    if cached is not None:
+        all_file_url_df, releases = cached
+        return all_file_url_df.copy(), list(releases)
+
+    file_list = []
     releases = []
-    for url in urls:
-        response = get_api(api_url=url, token=token)
+    complete = True
+
+    # query the month urls in parallel
+    responses = get_api_many(url_set=urls, token=token)
+
+    for response in responses:
         if response is None:
             logging.info(
                 "Data file retrieval failed. Check NEON data portal for outage alerts.")
+            complete = False
+            continue
 
         # get release info
-        release = response.json()['data']['release']
+        response_dict = parse_json(response)
+        release = response_dict['data']['release']
         releases.append(release)
 
-        file_url_dict = response.json()['data']['files']
-        file_url_df = pd.DataFrame(data=file_url_dict)
-        file_url_df['release'] = release
+        # skip the files of provisional months if they are not wanted
+        if release == 'PROVISIONAL' and not include_provisional:
+            continue
+
+        # collect the file records from all months, tagged with the release
+        file_list.extend(dict(f, release=release)
+                         for f in response_dict['data']['files'])
 
-        # drop md5 and crc32 columns, which are all NaNs
-        file_url_df.drop(columns=['md5', 'crc32'], inplace=True)
+    # build the dataframe once, from all the file records, keeping only the
+    # columns used (md5 and crc32 are all NaNs). Naming the columns also
+    # gives an empty dataframe the same columns when no files are found.
+    # The text columns are stored as Arrow strings, which are smaller than
+    # python objects and let the later name matching run in Arrow.
+    all_file_url_df = pd.DataFrame(
+        file_list, columns=['name', 'size', 'crc32c', 'url', 'release']
+    ).astype({'name': 'string[pyarrow]', 'crc32c': 'string[pyarrow]',
+              'url': 'string[pyarrow]', 'release': 'string[pyarrow]'})
+    releases = list(set(releases))
 
-        # append the new dataframe to the existing one
-        all_file_url_df = pd.concat(
-            [all_file_url_df, file_url_df], ignore_index=True)
+    # only keep complete results, so failed months are retried next time
+    if complete:
+        file_url_tables.set(key, (all_file_url_df.copy(), list(releases)))
 
-    return all_file_url_df, list(set(releases))
+    return all_file_url_df, releases
 
 # %%
 
 
+@lru_cache(maxsize=1)
+def get_shared_flights_dict():
+    """
+    This function reads the shared_flights.csv lookup file into a dictionary
+    mapping each collocated site to its flight site. The file is only read
+    once; the dictionary is cached for later calls.
+    """
+    shared_flights_file = (importlib_resources.files(
+        __resources__) / 'shared_flights.csv')
+
+    with shared_flights_file.open(newline='') as f:
+        shared_flights_dict = {row['site']: row['flightSite']
+                               for row in csv.DictReader(f)}
+
+    return shared_flights_dict
+
+
+@lru_cache(maxsize=1)
+def get_utm18_to_17_transformer():
+    """
+    This function creates the pyproj transformer from UTM zone 18N to 17N,
+    used to convert Blandy (BLAN) plot coordinates. The transformer is only
+    created once; it is cached for later calls.
+    """
+    from pyproj import Transformer
+
+    # utm zone 18N to utm zone 17N, as (easting, northing)
+    return Transformer.from_crs(32618, 32617, always_xy=True)
+
+
 def get_shared_flights(site):
     """
     This function retrieves shared flights information for a NEON site from
@@ -221,13 +308,7 @@ def get_shared_flights(site):
     'shared_flights.csv' located in the '__resources__' directory.
 
     """
-    shared_flights_file = (importlib_resources.files(
-        __resources__) / 'shared_flights.csv')
-
-    shared_flights_df = pd.read_csv(shared_flights_file)
-
-    shared_flights_dict = shared_flights_df.set_index(
-        ['site'])['flightSite'].to_dict()
+    shared_flights_dict = get_shared_flights_dict()
     if site in shared_flights_dict:
         flightSite = shared_flights_dict[site]
         if site in ['TREE', 'CHEQ', 'KONA', 'DCFS']:
@@ -255,18 +336,56 @@ def get_neon_sites():
     return neon_sites_list
 
 
+# responses from the products endpoint, by data product ID and token,
+# reused for as long as file_url_tables
+product_responses = TimedCache(max_age=api_cache_max_age)
+
+
+def get_product_response(dpid, token=None):
+    """
+    This function queries the products endpoint of the NEON API for a data
+    product. Successful responses are reused for 10 minutes, so downloading
+    the same product for several sites or years only queries the product
+    metadata once, while newly published months still show up in a long
+    session.
+
+    Parameters
+    --------
+    dpid: str
+        The identifier of the NEON data product, e.g. DP3.30001.001.
+
+    token: str, optional
+        User-specific API token from data.neonscience.org user account.
+
+    Returns
+    --------
+    The API response, or None if the request failed.
+
+    """
+    key = (dpid, token)
+    response = product_responses.get(key)
+    if response is not None:
+        return response
+
+    response = get_api(
+        "https://data.neonscience.org/api/v0/products/" + dpid, token)
+    if response is None:
+        return None
+    product_responses.set(key, response)
+
+    return response
+
+
 def get_data_product_name(dpid):
-    dpid_api_response = get_api(
-        f'https://data.neonscience.org/api/v0/products/{dpid}')
-    product_name = dpid_api_response.json()['data']['productName']
+    dpid_api_response = get_product_response(dpid)
+    product_name = parse_json(dpid_api_response)['data']['productName']
     return product_name
 
 # %% functions to validate inputs for by_file_aop and by_tile_aop
 
 
 def validate_dpid(dpid):
-    dpid_pattern = "DP[1-4]{1}.[0-9]{5}.00[1-2]{1}"
-    if not re.fullmatch(dpid_pattern, dpid):
+    if not dpid_pattern.fullmatch(dpid):
         raise ValueError(
             f'{dpid} is not a properly formatted data product ID. The correct format is DP#.#####.00#')
 
@@ -323,11 +442,8 @@ def validate_aop_dpid(dpid):
     Raises:
     - ValueError: If the dpid does not match the expected pattern or is not in the list of valid IDs.
     """
-    # Regular expression pattern for AOP data product IDs
-    aop_dpid_pattern = "DP[1-3]{1}.300[0-2]{1}[0-9]{1}.00[1-2]{1}"
-
-    # Check if the dpid matches the pattern
-    if not re.fullmatch(aop_dpid_pattern, dpid):
+    # Check if the dpid matches the pattern for AOP data product IDs
+    if not aop_dpid_pattern.fullmatch(dpid):
         raise ValueError(
             f'{dpid} is not a valid AOP data product ID. AOP data products follow the format DP#.300##.00#.')
 
@@ -381,8 +497,7 @@ def check_field_spectra_dpid(dpid):
 
 
 def validate_site_format(site):
-    site_pattern = "[A-Z]{4}"
-    if not re.fullmatch(site_pattern, site):
+    if not site_pattern.fullmatch(site):
         raise ValueError(
             f'{site} is an invalid site format. A four-letter NEON site code is required. NEON site codes can be found here: https://www.neonscience.org/field-sites/explore-field-sites')
 
@@ -397,8 +512,7 @@ def validate_neon_site(site):
 
 def validate_year(year):
     # year = str(year)
-    year_pattern = "20[1-9][0-9]"
-    if not re.fullmatch(year_pattern, year):
+    if not year_pattern.fullmatch(year):
         raise ValueError(
             f'{year} is an invalid year. Year is required in the format "2017" or 2017, eg. AOP data are available from 2013 to present.')
 
@@ -414,7 +528,10 @@ def get_site_year_urls(response_dict, site, year):
     site_info = next(
         item for item in response_dict['data']['siteCodes'] if item["siteCode"] == site)
     site_urls = site_info['availableDataUrls']
-    site_year_urls = [url for url in site_urls if str(year) in url]
+    # the urls end in /YYYY-MM; match the year there, rather than anywhere
+    # in the url
+    year_month = f"/{year}-"
+    site_year_urls = [url for url in site_urls if year_month in url]
     return site_year_urls
 
 
@@ -449,8 +566,7 @@ def list_available_dates(dpid, site):
     @author: Bridget Hass
 
     """
-    product_url = "http://data.neonscience.org/api/v0/products/" + dpid
-    response = get_api(api_url=product_url)  # add input for token?
+    response = get_product_response(dpid)  # add input for token?
 
     # raise value error and print message if dpid isn't formatted as expected
     validate_dpid(dpid)
@@ -463,10 +579,10 @@ def list_available_dates(dpid, site):
     validate_neon_site(site)
 
 # get available releases & months:
-    for i in range(len(response.json()['data']['siteCodes'])):
-        if site in response.json()['data']['siteCodes'][i]['siteCode']:
-            available_releases = response.json(
-            )['data']['siteCodes'][i]['availableReleases']
+    site_codes = parse_json(response)['data']['siteCodes']
+    for i in range(len(site_codes)):
+        if site in site_codes[i]['siteCode']:
+            available_releases = site_codes[i]['availableReleases']
 
 # display available release tags (including provisional) and dates for each tag
     try:
@@ -509,9 +625,6 @@ def get_tile_bounds(file_url_df, all_bounds=False):
     >>> x_bounds, y_bounds, sorted_coords = get_tile_bounds(file_url_df)
     """
 
-    # Regular expression to match UTM coordinates in the format 'xxxxxx_yyyyyyy'
-    utm_pattern = re.compile(r'(\d{6})_(\d{7})')
-
     # lists to store x and y coordinates
     x_coords = []
     y_coords = []
@@ -519,8 +632,8 @@ def get_tile_bounds(file_url_df, all_bounds=False):
 
     # filter out rows where 'name' ends with '.tif' , '.h5' or '.laz'
     # this will exclude shapefiles, just in case they don't match
-    data_df = file_url_df[file_url_df['name'].str.endswith(
-        ('.tif', '.h5', '.laz', '.zip'))]
+    data_df = file_url_df[file_url_df['name'].str.contains(
+        r'\.(?:tif|h5|laz|zip)$')]
 
     # Iterate over each name in the DataFrame
     for name in data_df['name']:
@@ -617,8 +730,7 @@ def get_aop_tile_extents(dpid,
         token = None
 
     # query the products endpoint for the product requested
-    response = get_api(
-        "http://data.neonscience.org/api/v0/products/" + dpid, token)
+    response = get_product_response(dpid, token)
 
     # exit function if response is None (eg. if no internet connection)
     if response is None:
@@ -632,7 +744,7 @@ def get_aop_tile_extents(dpid,
         #     print('API token was not recognized. Public rate limit applied.\n')
 
     # get the request response dictionary
-    response_dict = response.json()
+    response_dict = parse_json(response)
 
     # error message if dpid is not an AOP data product
     check_aop_dpid(response_dict, dpid)
@@ -671,18 +783,92 @@ def get_aop_tile_extents(dpid,
 # %%
 
 
+def download_aop_files(files, download_path, chunk_size=1048576, token=None,
+                       max_workers=8, sizes=None):
+    """
+    This function downloads a list of AOP files in parallel, using a pool of
+    threads, and displays a progress bar of the data downloaded (or of the
+    files completed, if the file sizes are not provided).
+
+    Parameters
+    --------
+    files: list of str
+        The URLs of the files to download.
+
+    download_path: str
+        The directory to download the files to.
+
+    chunk_size: int, optional
+        Size in bytes of chunk for chunked download. Defaults to 1048576 (1 MB).
+
+    token: str, optional
+        User-specific API token from data.neonscience.org user account.
+
+    max_workers: int, optional
+        Maximum number of files to download at the same time. Defaults to 8.
+
+    sizes: list of int, optional
+        The expected sizes of the files in bytes, in the same order as files.
+        If provided, files already downloaded completely are skipped, and
+        partially downloaded files are resumed.
+
+    Returns
+    --------
+    None; data are downloaded to the directory specified.
+
+    """
+    if sizes is None:
+        jobs = [(file, None) for file in files]
+    else:
+        # start the largest files first, so the small files (readmes,
+        # metadata) fill in around them rather than leaving one large
+        # download running on its own at the end
+        jobs = sorted(zip(files, sizes), key=lambda job: job[1],
+                      reverse=True)
+
+    # with known sizes, show progress in bytes, updated as each chunk is
+    # written; otherwise count completed files
+    if sizes is None:
+        pbar = tqdm(total=len(files), unit='file')
+        progress = None
+    else:
+        pbar = tqdm(total=sum(sizes), unit='B', unit_scale=True,
+                    unit_divisor=1024)
+        # the download threads all update the bar, and tqdm's update isn't
+        # safe to call from several threads at once, so take turns
+        pbar_lock = threading.Lock()
+
+        def progress(n):
+            with pbar_lock:
+                pbar.update(n)
+
+    with pbar, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(download_file, url=file,
+                                   savepath=download_path,
+                                   chunk_size=chunk_size, token=token,
+                                   size=size, progress=progress)
+                   for file, size in jobs]
+        for future in as_completed(futures):
+            future.result()
+            if progress is None:
+                pbar.update(1)
+
+    return
+
+
 def by_file_aop(dpid,
                 site,
                 year,
                 include_provisional=False,
                 check_size=True,
                 savepath=None,
-                chunk_size=1024,
-                token=None):
+                chunk_size=1048576,
+                token=None,
+                max_workers=8):
     """
     This function queries the NEON API for AOP data by site, year, and product, and downloads all
-    files found, preserving the original folder structure. It downloads files serially to
-    avoid API rate-limit overload, which may take a long time.
+    files found, preserving the original folder structure. It downloads several files at a time,
+    in parallel; large downloads may still take a long time.
 
     Parameters
     --------
@@ -709,13 +895,16 @@ def by_file_aop(dpid,
         The file path to download to. Defaults to None, in which case the working directory is used.
 
     chunk_size: integer, optional
-        Size in bytes of chunk for chunked download. Defaults to 1024.
+        Size in bytes of chunk for chunked download. Defaults to 1048576 (1 MB).
 
     token: str, optional
         User-specific API token from data.neonscience.org user account. See
         https://data.neonscience.org/data-api/rate-limiting/ for details about
         API rate limits and user tokens.
 
+    max_workers: int, optional
+        Maximum number of files to download at the same time. Defaults to 8.
+
     Returns
     --------
     None; data are downloaded to the local directory specified.
@@ -768,8 +957,7 @@ def by_file_aop(dpid,
         token = None
 
     # query the products endpoint for the product requested
-    response = get_api(
-        "http://data.neonscience.org/api/v0/products/" + dpid, token)
+    response = get_product_response(dpid, token)
 
     # exit function if response is None (eg. if no internet connection)
     if response is None:
@@ -783,7 +971,7 @@ def by_file_aop(dpid,
         #     print('API token was not recognized. Public rate limit applied.\n')
 
     # get the request response dictionary
-    response_dict = response.json()
+    response_dict = parse_json(response)
 
     # error message if dpid is not an AOP data product
     check_aop_dpid(response_dict, dpid)
@@ -801,35 +989,28 @@ def by_file_aop(dpid,
         # print("There are no data available at the selected site and year.")
         return
 
-    # get file url dataframe for the available month urls
-    file_url_df, releases = get_file_urls(site_year_urls, token=token)
+    # get file url dataframe for the available month urls, leaving out the
+    # provisional months unless they are included
+    file_url_df, releases = get_file_urls(
+        site_year_urls, token=token, include_provisional=include_provisional)
 
     # get the number of files in the dataframe, if there are no files to download, return
-    if len(file_url_df) == 0:
-        # print("No data files found.")
-        logging.info("No data files found.")
+    num_files = len(file_url_df)
+    if num_files == 0:
+        if 'PROVISIONAL' in releases and not include_provisional:
+            logging.info(
+                "Provisional data are not included. To download provisional data, use input parameter include_provisional=True.")
+            logging.info(
+                "No data files found. Available data may all be provisional. To download provisional data, use input parameter include_provisional=True.")
+        else:
+            logging.info("No data files found.")
         return
 
-    # if 'PROVISIONAL' in releases and not include_provisional:
     if include_provisional:
         # print provisional included message
         print("Provisional data are included. To exclude provisional data, use input parameter include_provisional=False.")
         logging.info(
             "Provisional data are included. To exclude provisional data, use input parameter include_provisional=False.")
-    else:
-        # print provisional not included message and filter to the released data
-        # logging.info(
-        #     "Provisional data are not included. To download provisional data, use input parameter include_provisional=True.")
-        file_url_df = file_url_df[file_url_df['release'] != 'PROVISIONAL']
-        if len(file_url_df) == 0:
-            logging.info(
-                "Provisional data are not included. To download provisional data, use input parameter include_provisional=True.")
-
-    num_files = len(file_url_df)
-    if num_files == 0:
-        logging.info(
-            "No data files found. Available data may all be provisional. To download provisional data, use input parameter include_provisional=True.")
-        return
 
     # get the total size of all the files found
     download_size_bytes = file_url_df['size'].sum()
@@ -850,14 +1031,14 @@ def by_file_aop(dpid,
         download_path = os.getcwd() + "/" + dpid
     os.makedirs(download_path, exist_ok=True)
 
-    # serially download all files, with progress bar
-    files = list(file_url_df['url'])
+    # download all files in parallel, with progress bar
+    files = file_url_df['url'].tolist()
+    sizes = file_url_df['size'].tolist()
     print(
         f"Downloading {num_files} files totaling approximately {download_size}\n")
     sleep(1)
-    for file in tqdm(files):
-        download_file(url=file, savepath=download_path,
-                      chunk_size=chunk_size, token=token)
+    download_aop_files(files, download_path, chunk_size=chunk_size,
+                       token=token, max_workers=max_workers, sizes=sizes)
 
     # download issue log table
     ilog = get_issue_log(dpid=dpid, token=None)
@@ -901,14 +1082,15 @@ def by_tile_aop(dpid,
                 include_provisional=False,
                 check_size=True,
                 savepath=None,
-                chunk_size=1024,
+                chunk_size=1048576,
                 token=None,
-                verbose=False):
+                verbose=False,
+                max_workers=8):
     """
     This function queries the NEON API for AOP data by site, year, product, and
     UTM coordinates, and downloads all files found, preserving the original
-    folder structure. It downloads files serially to avoid API rate-limit
-    overload, which may take a long time.
+    folder structure. It downloads several files at a time, in parallel;
+    large downloads may still take a long time.
 
     Parameters
     --------
@@ -921,11 +1103,11 @@ def by_tile_aop(dpid,
     year: str or int
         The four-digit year of data collection.
 
-    easting: int or list of int
-        A number or list containing the easting UTM coordinate(s) of the locations to download.
+    easting: int or list or array of int
+        A number, list, or array containing the easting UTM coordinate(s) of the locations to download.
 
-    northing: int or list of int
-        A number or list containing the northing UTM coordinate(s) of the locations to download.
+    northing: int or list or array of int
+        A number, list, or array containing the northing UTM coordinate(s) of the locations to download.
 
     buffer: int, optional
         Size, in meters, of the buffer to be included around the coordinates when determining which tiles to download. Defaults to 0.
@@ -944,7 +1126,7 @@ def by_tile_aop(dpid,
         The file path to download to. Defaults to None, in which case the working directory is used.
 
     chunk_size: int, optional
-        Size in bytes of chunk for chunked download. Defaults to 1024.
+        Size in bytes of chunk for chunked download. Defaults to 1048576 (1 MB).
 
     token: str, optional
         User-specific API token from data.neonscience.org user account. See
@@ -954,6 +1136,9 @@ def by_tile_aop(dpid,
     verbose: bool, optional
         If set to True, the function will print information about the downloaded tiles.
 
+    max_workers: int, optional
+        Maximum number of files to download at the same time. Defaults to 8.
+
     Return
     --------
     None; data are downloaded to the local directory specified.
@@ -1005,22 +1190,17 @@ def by_tile_aop(dpid,
     year = str(year)  # cast year to string (if it's not already)
     validate_year(year)
 
-    # convert easting and northing to lists, if they are not already
-    if type(easting) is not list:
-        easting = [easting]
-    if type(northing) is not list:
-        northing = [northing]
-
-    # convert to floats, and display error message if easting and northing lists are not numeric
+    # convert easting and northing to numpy arrays of floats, and display
+    # error message if easting and northing are not numeric
     try:
-        easting = [float(e) for e in easting]
+        easting = np.ascontiguousarray(np.atleast_1d(easting), dtype=np.float64)
     except ValueError as e:
         logging.info(
             'The easting is invalid, this is required as a number or numeric list format, eg. 732000 or [732000, 733000]')
         print(e)
 
     try:
-        northing = [float(e) for e in northing]
+        northing = np.ascontiguousarray(np.atleast_1d(northing), dtype=np.float64)
     except ValueError as e:
         logging.info(
             'The northing is invalid, this is required as a number or numeric list format, eg. 4713000 or [4713000, 4714000]')
@@ -1029,23 +1209,25 @@ def by_tile_aop(dpid,
     # link easting and northing coordinates - as a list of tuples ?
     # coord_tuples = [(easting[i], northing[i]) for i in range(0, len(easting))]
 
-    # error message if easting and northing vector lengths don't match (also handles empty/NA cases)
+    # error message if easting and northing vector lengths don't match
     # there should not be any strings now that everything has been converted to a float
-    easting = [e for e in easting if not np.isnan(e)]
-    northing = [n for n in northing if not np.isnan(n)]
-
     if len(easting) != len(northing):
         logging.info(
             'Easting and northing list lengths do not match, and/or contain null values. Cannot identify paired coordinates.')
         return
 
+    # drop coordinate pairs where either value is missing, so the remaining
+    # eastings and northings stay paired
+    paired = np.isfinite(easting) & np.isfinite(northing)
+    easting = easting[paired]
+    northing = northing[paired]
+
     # if token is an empty string, set to None
     if token == '':
         token = None
 
     # query the products endpoint for the product requested
-    response = get_api(
-        "http://data.neonscience.org/api/v0/products/" + dpid, token)
+    response = get_product_response(dpid, token)
 
     # exit function if response is None (eg. if no internet connection)
     if response is None:
@@ -1057,7 +1239,7 @@ def by_tile_aop(dpid,
         check_token(response)
 
     # get the request response dictionary
-    response_dict = response.json()
+    response_dict = parse_json(response)
     # error message if dpid is not an AOP data product
     if response_dict['data']['productScienceTeamAbbr'] != 'AOP':
         print(
@@ -1076,67 +1258,50 @@ def by_tile_aop(dpid,
             f"There are no {dpid} data available at the site {site} in {year}.\nTo display available dates for a given data product and site, use the function list_available_dates().")
         return
 
-    # get file url dataframe for the available month url(s)
-    file_url_df, releases = get_file_urls(site_year_urls, token=token)
+    # get file url dataframe for the available month url(s), leaving out the
+    # provisional months unless they are included
+    file_url_df, releases = get_file_urls(
+        site_year_urls, token=token, include_provisional=include_provisional)
 
-    # get the number of files in the dataframe, if there are no files to download, return
-    if len(file_url_df) == 0:
-        logging.info("No data files found.")
-        return
-
-    # if 'PROVISIONAL' in releases and not include_provisional:
     if include_provisional:
         # print provisional included message
         logging.info(
             "Provisional data are included. To exclude provisional data, use input parameter include_provisional=False.")
     else:
         # print provisional not included message
-        file_url_df = file_url_df[file_url_df['release'] != 'PROVISIONAL']
         logging.info(
             "Provisional data are not included. To download provisional data, use input parameter include_provisional=True.")
 
-        # get the number of files in the dataframe after filtering for provisional data, if there are no files to download, return
-        num_files = len(file_url_df)
-        if num_files == 0:
+    # get the number of files in the dataframe, if there are no files to download, return
+    if len(file_url_df) == 0:
+        if 'PROVISIONAL' in releases and not include_provisional:
             logging.info(
                 "No data files found. Available data may all be provisional. To download provisional data, use input parameter include_provisional=True.")
-            return
+        else:
+            logging.info("No data files found.")
+        return
 
     # BLAN edge-case - contains plots in 18N and plots in 17N; flight data are all in 17N
     # convert easting & northing coordinates for Blandy (BLAN) to 17N
 
-    if site == 'BLAN' and any([e <= 250000.0 for e in easting]):
+    if site == 'BLAN' and (easting <= 250000.0).any():
         # check that pyproj is installed
         try:
-            from pyproj import Proj, CRS
-            # importlib.import_module('pyproj')
+            proj18to17 = get_utm18_to_17_transformer()
         except ImportError:
             logging.info(
                 "Package pyproj is required for this function to work at the BLAN site. Install and re-try")
             return
 
-        crs17 = CRS.from_epsg(32617)  # utm zone 17N
-        crs18 = CRS.from_epsg(32618)  # utm zone 18N
-
-        proj18to17 = Proj.from_crs(crs_from=crs18, crs_to=crs17)
-
-        # link easting and northing coordinates so it's easier to parse the zone for each
-        coord_tuples = [(easting[i], northing[i])
-                        for i in range(0, len(easting))]
-
-        coords17 = [(e, n) for (e, n) in coord_tuples if e > 250000.0]
-        coords18 = [(e, n) for (e, n) in coord_tuples if e <= 250000.0]
-
-        # apply the projection transformation from 18N to 17N for each coordinate tuple
-
-        coords18_reprojected = [proj18to17.transform(
-            coords18[i][0], coords18[i][1]) for i in range(len(coords18))]
-
-        coords17.extend(coords18_reprojected)
+        # split the coordinates by zone, and apply the projection
+        # transformation from 18N to 17N to all 18N coordinates at once
+        in17 = easting > 250000.0
+        easting18, northing18 = proj18to17.transform(easting[~in17],
+                                                     northing[~in17])
 
         # re-set easting and northing
-        easting = [c[0] for c in coords17]
-        northing = [c[1] for c in coords17]
+        easting = np.concatenate([easting[in17], easting18])
+        northing = np.concatenate([northing[in17], northing18])
 
         logging.info('Blandy (BLAN) plots include two UTM zones, flight data '
                      'are all in 17N. Coordinates in UTM zone 18N have been '
@@ -1144,36 +1309,21 @@ def by_tile_aop(dpid,
                      'will need to make the same conversion to connect '
                      'airborne to ground data.')
 
-    # function to round down to the nearest 1000, in order to determine
-    # lower left coordinate of AOP tile to be downloaded
-    def round_down1000(val):
-        return int(np.floor(val/1000)*1000)
-
-    # function to get the coordinates of the tiles including the buffer
-    def get_buffer_coords(easting, northing, buffer):
-        # apply the buffer to the easting and northings
-        buffer_min_e = easting - buffer
-        buffer_min_n = northing - buffer
-        buffer_max_e = easting + buffer
-        buffer_max_n = northing + buffer
-
-        new_coords = [(buffer_min_e, buffer_min_n), (buffer_min_e, buffer_max_n),
-                      (buffer_max_e, buffer_min_n), (buffer_max_e, buffer_max_n)]
-
-        return new_coords
-
-    # get the tiles corresponding to the new coordinates (mins and maxes)
-    # if verbose:
-    #     print('getting coordinates of tiles, including the buffer')
-    buffer_coords = []
-    for e, n in zip(easting, northing):
-        buffer_coords.extend(get_buffer_coords(e, n, buffer))
-
-    buffer_coords_rounded = [
-        (round_down1000(c[0]), round_down1000(c[1])) for c in buffer_coords]
-    # remove duplicate coordinates
-    buffer_coords_set = list(set(buffer_coords_rounded))
-    buffer_coords_set.sort()
+    # get the coordinates of the tiles including the buffer: offset every
+    # point to the corners of its buffer, with steps of at most one tile
+    # width in between, so that buffers wider than a tile also pick up the
+    # tiles in the middle
+    offsets = np.append(np.arange(-buffer, buffer, 1000), buffer)
+    offsets_e, offsets_n = np.meshgrid(offsets, offsets)
+    buffer_coords = np.column_stack(
+        [(easting[:, None] + offsets_e.ravel()).ravel(),
+         (northing[:, None] + offsets_n.ravel()).ravel()])
+
+    # round down to the nearest 1000, in order to determine lower left
+    # coordinate of AOP tile to be downloaded
+    buffer_coords_rounded = (np.floor(buffer_coords / 1000) * 1000).astype(np.int64)
+    # remove duplicate coordinates (np.unique also sorts them)
+    buffer_coords_set = np.unique(buffer_coords_rounded, axis=0).tolist()
 
     utm17_eastings_str = ', '.join([str(round(e, 2)) for e in easting])
     utm17_northings_str = ', '.join(str(round(n, 2)) for n in northing)
@@ -1185,33 +1335,27 @@ def by_tile_aop(dpid,
         logging.info(
             'UTM (x, y) lower-left coordinates of tiles to be downloaded:')
         for coord in buffer_coords_set:
-            logging.info(coord)
-
-    # create the list of utm "easting_northing" strings that will be used to match to the tile names
-    coord_strs = ['_'.join([str(c[0]), str(c[1])])
-                  for c in buffer_coords_set]
+            logging.info(tuple(coord))
 
-    # append the .txt file to include the README - IS THIS NEEDED?
-    coord_strs.append('.txt')
+    # create the set of utm "easting_northing" strings that will be used to match to the tile names
+    coord_set = {f'{e}_{n}' for e, n in buffer_coords_set}
 
-    # subset the dataframe to include only the coordinate strings matching coord_strs
+    # subset the dataframe to include only the tiles matching coord_set, and
+    # the .txt README files. The tile coordinates are extracted from each
+    # file name once and looked up in the set, rather than matching every
+    # name against every coordinate.
     # if verbose:
     #     print('finding the tiles')
-    file_url_df_subset = file_url_df[file_url_df['name'].str.contains(
-        '|'.join(coord_strs))]
-
-    file_url_df_subset2 = file_url_df_subset[~file_url_df_subset['name'].str.endswith(
-        '.txt')]
+    file_coords = file_url_df['name'].str.extract(tile_pattern, expand=False)
+    is_txt = file_url_df['name'].str.endswith('.txt')
+    is_tile = file_coords.isin(coord_set) & ~is_txt
+    file_url_df_subset = file_url_df[is_tile | is_txt]
 
     # if any coordinates were not included in the data, print a warning message
     # Warning: the following coordinates are outside the bounds of site-year:
-    unique_coords_to_download = set(
-        file_url_df_subset2['name'].str.extract(r'_(\d+_\d+)_')[0])
-
-    coord_strs.remove('.txt')
-    # compare two lists:
-    coords_not_found = list(
-        set(coord_strs).difference(list(unique_coords_to_download)))
+    # the requested tiles with no matching file, sorted so the warning lists
+    # them in a stable order
+    coords_not_found = sorted(coord_set.difference(file_coords[is_tile]))
     if len(coords_not_found) > 0:
         print('Warning, the following coordinates fall outside the bounds of the site, so will not be downloaded:')
         for coord in coords_not_found:
@@ -1242,14 +1386,14 @@ def by_tile_aop(dpid,
     # print('download path', download_path)
     os.makedirs(download_path, exist_ok=True)
 
-    # serially download all files, with progress bar
-    files = list(file_url_df_subset['url'])
+    # download all files in parallel, with progress bar
+    files = file_url_df_subset['url'].tolist()
+    sizes = file_url_df_subset['size'].tolist()
     print(
         f"Downloading {num_files} files totaling approximately {download_size}\n")
     sleep(1)
-    for file in tqdm(files):
-        download_file(url=file, savepath=download_path,
-                      chunk_size=chunk_size, token=token)
+    download_aop_files(files, download_path, chunk_size=chunk_size,
+                       token=token, max_workers=max_workers, sizes=sizes)
 
     # download issue log table
     ilog = get_issue_log(dpid=dpid, token=None)
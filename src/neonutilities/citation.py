@@ -1,20 +1,30 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from datetime import datetime
+from functools import lru_cache
 import requests
+from .helper_mods.api_helpers import get_api
+from .helper_mods.api_helpers import parse_json
+
+
+def make_provisional_citation(dpid, name, year):
+    """
+    Fill in the BibTex template for provisional data, which don't have a DOI.
+    """
+    return f"@misc{{{dpid}/provisional,\n  doi = {{}},\n  url = {{https://data.neonscience.org/data-products/{dpid}}},\n  author = {{{{National Ecological Observatory Network (NEON)}}}},\n  language = {{en}},\n  title = {{{name} ({dpid})}},\n  publisher = {{National Ecological Observatory Network (NEON)}},\n  year = {{{year}}}\n}}"
 
 
 def get_citation(dpid, release):
     """
-    Use the DOI Foundation API to get BibTex-formatted citations for NEON data, 
-    or use a template to generate a BibTex citation for provisional data. 
+    Use the DOI Foundation API to get BibTex-formatted citations for NEON data,
+    or use a template to generate a BibTex citation for provisional data.
     Helper function to download and stacking functions.
 
     Parameters
     ----------
     dpid: str
         The data product ID of the data to be cited
-        
+
     release: str
         The data release to be cited. Can be provisional.
 
@@ -24,7 +34,7 @@ def get_citation(dpid, release):
 
     Example
     -------
-    Get the citation for Breeding landbird point counts (DP1.10003.001), 
+    Get the citation for Breeding landbird point counts (DP1.10003.001),
     RELEASE-2023
 
     >>> cit = get_citation(dpid="DP1.10003.001", release="RELEASE-2023")
@@ -34,37 +44,62 @@ def get_citation(dpid, release):
     @author: Claire Lunch
     """
 
-    if release == "PROVISIONAL":
+    # the year is part of the provisional citation, so it is included in
+    # the arguments to the cached function
+    return _get_citation(dpid, release, datetime.now().year)
+
+
+@lru_cache(maxsize=512)
+def _get_product_name(dpid):
+    """
+    Get the name of a data product from the NEON API. Results are cached,
+    since the name is requested each time a citation is constructed.
+    """
+
+    nm_req = get_api("https://data.neonscience.org/api/v0/products/" +
+                     dpid)
+    if nm_req is None:
+        raise ConnectionError(
+            f"Product information for {dpid} could not be retrieved from the NEON API.")
+    nm_str = parse_json(nm_req)
+    return nm_str["data"]["productName"]
 
-        # construct citation from template
-        citI = "@misc{DPID/provisional,\n  doi = {},\n  url = {https://data.neonscience.org/data-products/DPID},\n  author = {{National Ecological Observatory Network (NEON)}},\n  language = {en},\n  title = {NAME (DPID)},\n  publisher = {National Ecological Observatory Network (NEON)},\n  year = {YEAR}\n}"
-        citDP = citI.replace("DPID", dpid)
-        citY = citDP.replace("YEAR", str(datetime.now().year))
 
-        nm_req = requests.get("https://data.neonscience.org/api/v0/products/" +
-                              dpid)
-        nm_str = nm_req.json()
-        nm = nm_str["data"]["productName"]
+@lru_cache(maxsize=1024)
+def _get_citation(dpid, release, year):
+    """
+    Construct or retrieve the citation for a data product and release.
+    Results are cached, so repeated calls don't re-query the APIs.
+    """
 
-        cit = citY.replace("NAME", nm)
+    if release == "PROVISIONAL":
+
+        # construct citation from template
+        nm = _get_product_name(dpid)
+        cit = make_provisional_citation(dpid=dpid, name=nm, year=year)
         return cit
 
     else:
 
         # get DOI from NEON API, then citation from DOI API
-        pr_req = requests.get("https://data.neonscience.org/api/v0/products/" +
-                              dpid)
-        pr_str = pr_req.json()
+        pr_req = get_api("https://data.neonscience.org/api/v0/products/" +
+                         dpid)
+        if pr_req is None:
+            raise ConnectionError(
+                f"Release information for {dpid} could not be retrieved from the NEON API.")
+        pr_str = parse_json(pr_req)
         rels = pr_str["data"]["releases"]
         relinfo = next((i for i in rels if i["release"] == release), None)
-        
+
         if relinfo is None:
-            print("There are no data with dpid=" + dpid + 
+            print("There are no data with dpid=" + dpid +
                   " and release=" + release)
             return relinfo
 
         else:
             doi = relinfo["productDoi"]["url"]
-            doi_req = requests.get(doi, 
+            doi_req = requests.get(doi,
                                    headers={"accept": "application/x-bibtex"})
+            # raise rather than return (and cache) an error page
+            doi_req.raise_for_status()
             return doi_req.text
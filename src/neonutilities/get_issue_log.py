@@ -17,9 +17,14 @@ import re
 import logging
 import pandas as pd
 from .helper_mods.api_helpers import get_api
+from .helper_mods.api_helpers import get_api_many
+from .helper_mods.api_helpers import parse_json
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
+# data product ID format, compiled once
+dpid_pattern = re.compile(r"DP[1-4]\.[0-9]{5}\.00[1-2]")
+
 # %% functions to validate inputs (should pull these out into another helper module??)
 
 
@@ -33,8 +38,7 @@ def validate_dpid(dpid):
     Raises:
         ValueError: If the DPID is not in the correct format.
     """
-    dpid_pattern = "DP[1-4]{1}.[0-9]{5}.00[1-2]{1}"
-    if not re.fullmatch(dpid_pattern, dpid):
+    if not dpid_pattern.fullmatch(dpid):
         raise ValueError(
             f'{dpid} is not a properly formatted data product ID. The correct format is DP#.#####.00#')
 
@@ -57,10 +61,25 @@ def get_change_log_df(dpid, token=None):
     """
     req = get_api(
         api_url=f"https://data.neonscience.org/api/v0/products/{dpid}", token=token)
+
+    return parse_change_log(req, dpid)
+
+
+def parse_change_log(req, dpid):
+    """
+    Extracts the change log from a products endpoint response.
+
+    Args:
+        req: The API response for the data product, or None if the request failed.
+        dpid (str): The NEON data product ID, used in the message if the request failed.
+
+    Returns:
+        change_log_df: A DataFrame containing the changeLogs for the provided dpid.
+    """
     if req is None:
         logging.info(f"Error in metadata retrieval for {dpid}. Issue log not found.")
         return None
-    all_product_info = pd.json_normalize(req.json()['data'])
+    all_product_info = pd.json_normalize(parse_json(req)['data'])
     change_log_df = pd.DataFrame(all_product_info['changeLogs'][0])
 
     return change_log_df
@@ -88,8 +107,14 @@ def get_eddy_issue_log(dpid, token=None):
 
     eddy_issue_log_list = []
 
-    for dpid in bundle_dps:
-        change_log_df = get_change_log_df(dpid, token=token)
+    # the API has no multi-product query, so request the bundled products
+    # concurrently rather than one after another
+    reqs = get_api_many(
+        url_set=[f"https://data.neonscience.org/api/v0/products/{dp}" for dp in bundle_dps],
+        token=token)
+
+    for dpid, req in zip(bundle_dps, reqs):
+        change_log_df = parse_change_log(req, dpid)
         if change_log_df is not None and not change_log_df.empty:
             change_log_df['dpid'] = dpid
             eddy_issue_log_list.append(change_log_df)
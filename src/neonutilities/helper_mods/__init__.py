@@ -1,5 +1,9 @@
 from .api_helpers import get_api
+from .api_helpers import get_api_many
+from .api_helpers import get_api_async
+from .api_helpers import parse_json
 from .api_helpers import get_api_headers
+from .api_helpers import get_api_headers_many
 from .api_helpers import get_zip_urls
 from .api_helpers import download_urls
 from .api_helpers import download_file
@@ -2,24 +2,276 @@
 # -*- coding: utf-8 -*-
 
 import requests
+import urllib3
+import asyncio
 import re
 import os
 import time
+import random
+import threading
+import functools
+import hashlib
+import sqlite3
 import platform
 import importlib.metadata
 import logging
 import warnings
 import pandas as pd
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from .metadata_helpers import get_recent
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
-# Set global user agent
-vers = importlib.metadata.version('neonutilities')
-plat = platform.python_version()
-osplat = platform.platform()
+class NeonRetry(urllib3.util.Retry):
+    """
+    Retry settings for requests to NEON. When the API's rate limit is reached,
+    the wait time is sent in the x-ratelimit-reset header rather than
+    Retry-After, so use that if there is no Retry-After header.
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None and response.status == 429:
+            time_reset = response.headers.get("x-ratelimit-reset")
+            if time_reset is not None and time_reset.isdigit():
+                retry_after = float(time_reset)
+        return retry_after
+
+
+# Retry rate-limited (429) and temporarily unavailable (5xx) responses, with
+# exponential backoff, or the wait time sent by the server if there is one.
+# Connection errors are not retried here; get_api() decides whether to retry
+# them, so that it can give up straight away if there is no network.
+retry_settings = dict(total=4,
+                      connect=0,
+                      read=0,
+                      other=0,
+                      status=4,
+                      backoff_factor=1,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET", "HEAD"],
+                      respect_retry_after_header=True,
+                      raise_on_status=False)
+try:
+    retries = NeonRetry(backoff_jitter=0.5, backoff_max=30, **retry_settings)
+except TypeError:
+    # urllib3 < 2 doesn't accept the backoff_jitter or backoff_max arguments,
+    # and urllib3 < 1.26 calls allowed_methods method_whitelist
+    try:
+        retries = NeonRetry(**retry_settings)
+    except TypeError:
+        retry_settings["method_whitelist"] = retry_settings.pop(
+            "allowed_methods")
+        retries = NeonRetry(**retry_settings)
+
+
+@functools.lru_cache(maxsize=1)
+def get_user_agent():
+    """
+    Returns the user agent sent with requests to NEON, made up of the
+    neonutilities, Python and platform versions. The package metadata is
+    only looked up on first use, rather than when the module is imported.
+    """
+    vers = importlib.metadata.version('neonutilities')
+    plat = platform.python_version()
+    osplat = platform.platform()
+
+    return f"neonutilities/{vers} Python/{plat} {osplat}"
+
+
+# Shared session for all requests to the NEON API and data storage. Reusing
+# the session keeps connections alive between calls, so repeated requests to
+# the same host don't pay for a new TCP and TLS handshake each time.
+# It is created on first use by get_session(), so importing the package
+# doesn't open the cache or look up the user agent.
+session = None
+session_lock = threading.Lock()
+
+# how long (in seconds) API responses are kept in the requests-cache cache,
+# so a new release or provisional data shows up within that time. The
+# in-memory caches in aop_download use the same limit.
+api_cache_max_age = 10 * 60
+
+# where requests-cache keeps its sqlite database
+http_cache_path = os.path.join(os.path.expanduser("~"), ".neonutilities",
+                               "http_cache")
+
+
+def get_session():
+    """
+    Returns the shared session for requests to NEON, creating it on first
+    use. If requests-cache is installed, responses from the NEON API are also
+    cached on disk for 10 minutes (api_cache_max_age), so repeated metadata
+    queries in that time don't go back to the API. Data files are never
+    cached. Responses are cached separately for each API token, but the token
+    itself isn't stored.
+    """
+    global session
+    if session is None:
+        with session_lock:
+            if session is None:
+                session = make_session()
+    return session
 
-usera = f"neonutilities/{vers} Python/{plat} {osplat}"
+
+def make_session():
+    """
+    Creates the session used by get_session().
+    """
+    try:
+        import requests_cache
+
+        # The token is redacted from the stored requests, so add a hash of
+        # it to the cache key instead. That way a response fetched with one
+        # token (or none) isn't served to a request made with another;
+        # among other things, its rate limit headers differ.
+        def cache_key(request, **kwargs):
+            key = requests_cache.create_key(request, **kwargs)
+            token = request.headers.get("X-API-TOKEN")
+            if token is None:
+                return key
+            return key + hashlib.sha256(token.encode()).hexdigest()[:16]
+
+        new_session = requests_cache.CachedSession(
+            cache_name=http_cache_path,
+            backend="sqlite",
+            expire_after=api_cache_max_age,
+            urls_expire_after={
+                "data.neonscience.org/api/v0/data/package/*":
+                    requests_cache.DO_NOT_CACHE,
+                "data.neonscience.org/api/v0/*": api_cache_max_age,
+                "*": requests_cache.DO_NOT_CACHE},
+            allowable_methods=("GET",),
+            cache_control=False,
+            stale_if_error=True,
+            ignored_parameters=["X-API-TOKEN"],
+            key_fn=cache_key)
+    except ImportError:
+        new_session = requests.Session()
+    except (OSError, sqlite3.Error) as e:
+        # the cache is only a speed-up, so carry on without it if it can't
+        # be opened, e.g. in a read-only home directory
+        warnings.warn(f"The NEON API response cache at {http_cache_path} could not be opened ({e!r}). Continuing without caching.")
+        new_session = requests.Session()
+    new_session.headers.update({"User-Agent": get_user_agent()})
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=10,
+                                            pool_maxsize=50,
+                                            max_retries=retries)
+    new_session.mount("https://", adapter)
+    new_session.mount("http://", adapter)
+
+    return new_session
+
+
+class RateLimiter:
+    """
+    Adaptive token bucket shared by all requests to the NEON API, so that
+    concurrent requests (e.g. from get_api_many) pace themselves instead of
+    all running into the rate limit together.
+
+    Tokens refill at the current rate, up to one second's worth. When the
+    API responds with 429, the rate is halved; after 100 successful requests
+    in a row it is increased again by one request per second, up to max_rate.
+
+    Parameters
+    --------
+    max_rate: Maximum number of requests per second.
+    min_rate: The rate is never reduced below this. Defaults to 0.5.
+
+    """
+
+    def __init__(self, max_rate, min_rate=0.5):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.tokens = max_rate
+        self.updated = time.monotonic()
+        self.successes = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, sleeping first if none are available.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(max(self.rate, 1),
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # the token is taken now, so later callers queue behind this one
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def success(self):
+        """
+        Record a successful request, and speed up after a run of them.
+        """
+        with self.lock:
+            self.successes += 1
+            if self.successes >= 100:
+                self.rate = min(self.max_rate, self.rate + 1)
+                self.successes = 0
+
+    def throttled(self):
+        """
+        Record a rate-limited (429) request, and slow down.
+        """
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+            self.successes = 0
+
+
+def get_max_rps(default=20):
+    """
+    Returns the maximum number of requests per second to the NEON API, from
+    the NU_MAX_RPS environment variable if it's set. A value that isn't a
+    positive number is ignored with a warning, and the default is used.
+    Values below 0.1 are raised to 0.1.
+    """
+    max_rps = os.environ.get("NU_MAX_RPS")
+    if max_rps is None:
+        return default
+    try:
+        rate = float(max_rps)
+    except ValueError:
+        rate = None
+    # also rules out nan and inf
+    if rate is None or not 0 < rate < float("inf"):
+        warnings.warn(f"NU_MAX_RPS must be a positive number, not '{max_rps}'. Using the default of {default} requests per second.")
+        return default
+    return max(rate, 0.1)
+
+
+# Requests per second to the NEON API, can be set with the NU_MAX_RPS
+# environment variable
+limiter = RateLimiter(max_rate=get_max_rps())
+
+# Parse API responses with orjson if it's installed, it's considerably
+# faster than the standard library json for the larger file listings
+try:
+    import orjson
+
+    def parse_json(response):
+        """
+        Parse the JSON body of an API response.
+        """
+        return orjson.loads(response.content)
+except ImportError:
+    def parse_json(response):
+        """
+        Parse the JSON body of an API response.
+        """
+        return response.json()
+
+
+# Requests to the API that are in progress, keyed by URL and token, so that
+# simultaneous identical requests from different threads are only sent once
+inflight = {}
+inflight_lock = threading.Lock()
 
 
 def get_api(api_url,
@@ -47,80 +299,180 @@ def get_api(api_url,
 
     @author: Zachary Nickerson
     """
-    def get_status_code_meaning(status_code):
-        return requests.status_codes._codes[status_code][0]
 
-    # Check internet connection
+    # If another thread is already requesting the same URL, wait for its
+    # response instead of sending an identical request
+    key = (api_url, token)
+    with inflight_lock:
+        future = inflight.get(key)
+        first = future is None
+        if first:
+            future = Future()
+            inflight[key] = future
+    if not first:
+        return future.result()
+
     try:
-        check_connection = requests.get("https://data.neonscience.org/",
-                                        headers={"User-Agent": usera})
-        if check_connection.status_code != 200:
-            status_code = check_connection.status_code
-            status_code_meaning = get_status_code_meaning(status_code)
-            raise ConnectionError(
-                f"Request failed with status code {status_code}, indicating '{status_code_meaning}'\n")
-    except Exception:  # ConnectionError as e
-        raise ConnectionError("Connection error. Cannot access NEON API.\n")
-
-    # Make 5 request attempts. If the rate limit is reached, pause for the
-    # burst reset time to try again.
-    j = 1
-
-    while (j <= 5):
-
-        # Try making the request
-        try:
-            # Construct URL either with or without token
-            if token is None:
-                response = requests.get(api_url, 
-                                        headers={"accept": "application/json",
-                                                 "User-Agent": usera})
-            else:
-                response = requests.get(
-                    api_url, headers={"X-API-TOKEN": token, 
-                                      "accept": "application/json",
-                                      "User-Agent": usera})
-
-            # Check for successful response
-            if response.status_code == 200:
-
-                if 'x-ratelimit-limit' in response.headers:
-                    # Retry get request if rate limit is reached
-                    limit_remain = response.headers.get(
-                        'x-ratelimit-remaining')
-
-                    if int(limit_remain) < 1:
-                        # Wait for the reset time
-                        time_reset = response.headers.get('x-ratelimit-reset')
-                        logging.info(
-                            f"Rate limit reached. Pausing for {time_reset} seconds to reset.\n")
-                        time.sleep(int(time_reset))
-                        # Increment loop to retry request attempt
-                        j += 1
+        response = request_api(api_url=api_url, token=token)
+        future.set_result(response)
+        return response
+    except BaseException as error:
+        future.set_exception(error)
+        raise
+    finally:
+        with inflight_lock:
+            del inflight[key]
 
-                    else:
-                        # If rate limit is not reached, exit out of loop
-                        j += 5
 
-                else:
-                    # If x-ratelimit-limit not found in headers, exit out of
-                    # loop (don't need to retry because of rate-limit)
-                    j += 5
+# Names of HTTP status codes, for reporting failed requests
+status_meanings = {code: names[0]
+                   for code, names in requests.status_codes._codes.items()}
 
-            else:
-                # Return nothing if request failed (status code is not 200)
-                # Print the status code and it's meaning
-                status_code_meaning = get_status_code_meaning(
-                    response.status_code)
-                raise ConnectionError(
-                    f"Request failed with status code {response.status_code}, indicating '{status_code_meaning}'\n")
 
-            return response
+def request_api(api_url,
+                token=None,
+                method="GET"):
+    """
+    Makes the API request for get_api() and get_api_headers(), with the
+    given HTTP method (GET or HEAD). Rate-limited and unavailable responses
+    are retried by the session's adapter; this retries if the connection
+    fails.
+    """
+    # Construct headers either with or without token
+    if token is None:
+        headers = {"accept": "application/json"}
+    else:
+        headers = {"X-API-TOKEN": token,
+                   "accept": "application/json"}
+
+    # Make up to 5 connection attempts
+    for attempt in range(5):
 
-        except Exception as error:
-            print(error)
+        # Make the request. There is no separate connectivity check; a
+        # failure to reach the API surfaces here as a connection error.
+        # Dropped connections and timeouts are usually transient, so back
+        # off and try again; other request errors won't be fixed by a retry.
+        limiter.acquire()
+        try:
+            response = get_session().request(method, api_url, headers=headers,
+                                             timeout=(5, 30))
+            break
+        except (requests.Timeout, requests.ConnectionError) as error:
+            # A host name that can't be resolved means there is no network
+            # connection, which won't come back within the retry window
+            # (urllib3 < 2 reports this as a generic NewConnectionError)
+            dns_error = getattr(urllib3.exceptions, "NameResolutionError",
+                                urllib3.exceptions.NewConnectionError)
+            no_dns = isinstance(getattr(error.args[0], "reason", None),
+                                dns_error) if error.args else False
+            if no_dns or attempt == 4:
+                raise ConnectionError("Connection error. Cannot access NEON API.\n") from error
+            delay = random.uniform(0, min(30, 2**attempt))
+            logging.info(
+                f"Connection to NEON API failed. Retrying in {round(delay)} seconds.\n")
+            time.sleep(delay)
+        except requests.RequestException as error:
+            print(f"Request failed: {error}\n")
             return None
 
+    # Slow down future requests if the rate limit was reached on the way
+    retry_history = getattr(getattr(response.raw, "retries", None),
+                            "history", None) or ()
+    for retry in retry_history:
+        if retry.status == 429:
+            limiter.throttled()
+
+    # Return nothing if the request failed, after any retries
+    # Print the status code and it's meaning
+    if response.status_code != 200:
+        status_code_meaning = status_meanings.get(response.status_code,
+                                                  "unknown")
+        print(f"Request failed with status code {response.status_code}, indicating '{status_code_meaning}'\n")
+        return None
+
+    limiter.success()
+
+    # If this request used up the rate limit, wait for the reset time so the
+    # next request isn't refused. Responses served from the cache don't
+    # count against the rate limit.
+    # check the header as a string rather than parsing it: less than 1 left
+    # means it's negative, or zero (all zeros, possibly padded)
+    limit_remain = response.headers.get('x-ratelimit-remaining', '').strip()
+    if limit_remain and (limit_remain.startswith("-")
+                         or not limit_remain.lstrip("0")) \
+            and not getattr(response, "from_cache", False):
+        time_reset = int(response.headers.get('x-ratelimit-reset', 0))
+        logging.info(
+            f"Rate limit reached. Pausing for {time_reset} seconds to reset.\n")
+        time.sleep(time_reset)
+
+    return response
+
+
+def get_api_many(url_set,
+                 token=None,
+                 max_workers=8,
+                 progress=False):
+    """
+
+    Accesses a set of API endpoints concurrently, with options to use the user-specific API token generated within neon.datascience user accounts.
+
+    Parameters
+    --------
+    url_set: A list of API endpoint URLs.
+    token: User specific API token (generated within neon.datascience user accounts). Optional.
+    max_workers: Maximum number of requests to make at the same time. Defaults to 8.
+    progress: Should the progress bar be displayed?
+
+    Return
+    --------
+    List of API GET responses, in the same order as url_set. As in get_api(), the entry for a failed request is None.
+
+    Example
+    --------
+    Get the data available for a product at two sites in the same month
+
+    >>> month_res = get_api_many(url_set=['https://data.neonscience.org/api/v0/data/DP1.10003.001/NIWO/2019-07',
+                                          'https://data.neonscience.org/api/v0/data/DP1.10003.001/PUUM/2019-07'])
+
+    """
+
+    # the requests are network-bound, so threads can overlap them; the
+    # shared session lets the threads reuse pooled connections
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = executor.map(lambda u: get_api(api_url=u, token=token),
+                                 url_set)
+        return list(tqdm(responses, total=len(url_set),
+                         disable=not progress))
+
+
+async def get_api_async(api_url,
+                        token=None):
+    """
+
+    Accesses the API without blocking the event loop, for use in asynchronous code. The request is made by get_api() in a worker thread, so it shares the session, retries, and rate limiting of get_api().
+
+    Parameters
+    --------
+    api_url: The API endpoint URL.
+    token: User specific API token (generated within neon.datascience user accounts). Optional.
+
+    Return
+    --------
+    API GET response containing status code and data that can be parsed into a json file
+
+    Example
+    --------
+    Get the data available for a product at two sites in the same month, concurrently
+
+    >>> month_res = await asyncio.gather(
+            get_api_async(api_url='https://data.neonscience.org/api/v0/data/DP1.10003.001/NIWO/2019-07'),
+            get_api_async(api_url='https://data.neonscience.org/api/v0/data/DP1.10003.001/PUUM/2019-07'))
+
+    """
+
+    return await asyncio.to_thread(get_api, api_url=api_url, token=token)
+
 
 def get_api_headers(api_url,
                     token=None):
@@ -135,7 +487,7 @@ def get_api_headers(api_url,
 
     Return
     --------
-    The header only from an API GET response
+    The header only from an API HEAD response
 
     Created on Feb 26 2024
 
@@ -143,79 +495,41 @@ def get_api_headers(api_url,
     @author: Zachary Nickerson
     @author: Claire Lunch
     """
-    def get_status_code_meaning(status_code):
-        return requests.status_codes._codes[status_code][0]
+    # Make the request the same way as get_api(), but only for the headers.
+    # Raise an error if the request failed, since the callers need the
+    # headers to continue.
+    response = request_api(api_url=api_url, token=token, method="HEAD")
+    if response is None:
+        raise ConnectionError(
+            "No response. NEON API may be unavailable, check NEON data portal for outage alerts. If the problem persists and can't be traced to an outage alert, check your computer for firewall or other security settings preventing Python from accessing the internet.")
 
-    # Check internet connection
-    try:
-        check_connection = requests.head("https://data.neonscience.org/",
-                                         headers={"User-Agent": usera})
-        if check_connection.status_code != 200:
-            status_code = check_connection.status_code
-            status_code_meaning = get_status_code_meaning(status_code)
-            raise ConnectionError(
-                f"Request failed with status code {status_code}, indicating '{status_code_meaning}'\n")
-    except Exception:  # ConnectionError as e
-        raise ConnectionError("No internet connection detected. Cannot access NEON API.\n")
-
-    # Make 5 request attempts. If the rate limit is reached, pause for the
-    # burst reset time to try again.
-    j = 1
-
-    while (j <= 5):
-
-        # Try making the request
-        try:
-            # Construct URL either with or without token
-            if token is None:
-                response = requests.head(api_url, 
-                                         headers={"accept": "application/json",
-                                                  "User-Agent": usera})
-            else:
-                response = requests.head(
-                    api_url, headers={"X-API-TOKEN": token, 
-                                      "accept": "application/json",
-                                      "User-Agent": usera})
-
-            # Check for successful response
-            if response.status_code == 200:
-
-                if 'x-ratelimit-limit' in response.headers:
-                    # Retry get request if rate limit is reached
-                    limit_remain = response.headers.get(
-                        'x-ratelimit-remaining')
-
-                    if int(limit_remain) < 1:
-                        # Wait for the reset time
-                        time_reset = response.headers.get('x-ratelimit-reset')
-                        logging.info(
-                            f"Rate limit reached. Pausing for {time_reset} seconds to reset.\n")
-                        time.sleep(int(time_reset))
-                        # Increment loop to retry request attempt
-                        j += 1
+    return response
 
-                    else:
-                        # If rate limit is not reached, exit out of loop
-                        j += 5
 
-                else:
-                    # If x-ratelimit-limit not found in headers, exit out of
-                    # loop (don't need to retry because of rate-limit)
-                    j += 5
+def get_api_headers_many(url_set,
+                         token=None,
+                         max_workers=8):
+    """
 
-            else:
-                # Return nothing if request failed (status code is not 200)
-                # Print the status code and it's meaning
-                status_code_meaning = get_status_code_meaning(
-                    response.status_code)
-                raise ConnectionError(
-                    f"Request failed with status code {response.status_code}, indicating '{status_code_meaning}'\n")
+    Gets the headers for a set of API endpoints concurrently, with options to use the user-specific API token generated within neon.datascience user accounts.
 
-            return response
+    Parameters
+    --------
+    url_set: A list of API endpoint URLs.
+    token: User specific API token (generated within neon.datascience user accounts). Optional.
+    max_workers: Maximum number of requests to make at the same time. Defaults to 8.
 
-        except Exception:
-            raise ConnectionError(
-                "No response. NEON API may be unavailable, check NEON data portal for outage alerts. If the problem persists and can't be traced to an outage alert, check your computer for firewall or other security settings preventing Python from accessing the internet.")
+    Return
+    --------
+    List of API HEAD responses, in the same order as url_set. As in get_api_headers(), an error is raised if any request fails.
+
+    """
+
+    # as in get_api_many(), threads overlap the network waits and share the
+    # session's pooled connections
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda u: get_api_headers(api_url=u, token=token), url_set))
 
 
 def get_zip_urls(url_set,
@@ -254,14 +568,15 @@ def get_zip_urls(url_set,
     if progress:
         logging.info("Finding available files")
 
-    for i in tqdm(range(0, len(url_set)), disable=not progress):
+    # get lists of files from data endpoint, querying the months in parallel
+    m_set = get_api_many(url_set=url_set, token=token, progress=progress)
+
+    for m_res in m_set:
 
-        # get list of files from data endpoint
-        m_res = get_api(api_url=url_set[i], token=token)
         if m_res is None:
             logging.info("Connection error for a subset of urls. Check outputs for missing data.")
             return None
-        m_di = m_res.json()
+        m_di = parse_json(m_res)
 
         # only keep queried release
         if release != "current":
@@ -289,25 +604,18 @@ def get_zip_urls(url_set,
                 logging.info(f"No expanded package found for site {m_di['data']['siteCode']} and month {m_di['data']['month']}. Basic package downloaded instead.")
                 package = "basic"
 
-        # get zip file url and file name
+        # get zip file url and file sizes
         zi = [u["url"] for u in m_di["data"]["packages"] if u["type"]==package]
-        h = get_api_headers(api_url=zi[0], token=token)
-        fltp = re.sub(pattern='"', repl="", 
-                      string=h.headers["content-disposition"])
-        flnmi = re.sub(pattern="inline; filename=", repl="", string=fltp)
-
-        # get file sizes
-        szr = re.compile(package)
-        flszs = [siz["size"] for siz in m_di["data"]["files"] if szr.search(siz["url"])]
-        flszi = sum(flszs)
-
-        # return url, file name, file size, and release
-        flnm.append(flnmi)
-        z.append(zi)
-        sz.append(flszi)
+        flszs = [siz["size"] for siz in m_di["data"]["files"] if package in siz["url"]]
+        z.append(zi[0])
+        sz.append(sum(flszs))
         rel.append(m_di["data"]["release"])
 
-    z = sum(z, [])
+    # get file names from the zip file headers, querying in parallel
+    for h in get_api_headers_many(url_set=z, token=token):
+        flnm.append(h.headers["content-disposition"].replace('"', "").replace(
+            "inline; filename=", ""))
+
     zpfiles = dict(flnm=flnm, z=z, sz=sz, rel=rel)
 
     # provisional message
@@ -374,14 +682,16 @@ def get_tab_urls(url_set,
     if progress:
         logging.info("Finding available files")
 
-    for i in tqdm(range(0, len(url_set)), disable=not progress):
+    # get lists of files from data endpoint, querying the months in parallel
+    m_set = get_api_many(url_set=url_set, token=token, progress=progress)
+
+    m_set_files = []
+    for m_res in m_set:
 
-        # get list of files from data endpoint
-        m_res = get_api(api_url=url_set[i], token=token)
         if m_res is None:
             logging.info("Connection error for a subset of urls. Check outputs for missing data.")
             return None
-        m_di = m_res.json()
+        m_di = parse_json(m_res)
 
         # only keep queried release
         if release != "current":
@@ -407,9 +717,16 @@ def get_tab_urls(url_set,
             logging.info(f"No files found for site {m_di['data']['siteCode']} and month {m_di['data']['month']}")
             continue
 
-        # get zip file url and file name
+        # get zip file url
         zi = [u["url"] for u in m_di["data"]["packages"] if u["type"] == package]
-        h = get_api_headers(api_url=zi[0], token=token)
+        m_set_files.append((m_di, flsp, zi[0]))
+
+    # get zip file names from the headers, querying in parallel
+    h_set = get_api_headers_many(url_set=[m[2] for m in m_set_files],
+                                 token=token)
+
+    for (m_di, flsp, _), h in zip(m_set_files, h_set):
+
         fltp = re.sub(pattern='"', repl="", 
                       string=h.headers["content-disposition"])
         flpthit = re.sub(pattern="inline; filename=", repl="", string=fltp)
@@ -424,12 +741,12 @@ def get_tab_urls(url_set,
         for f in rdmei:
             f["name"] = flpthi+f["name"]
 
-        varf.append(varfi)
-        rdme.append(rdmei)
+        varf.extend(varfi)
+        rdme.extend(rdmei)
         if len(spi) > 0:
             for f in spi:
                 f["name"] = flpthi + f["name"]
-            sp.append(spi)
+            sp.extend(spi)
 
         # subset by averaging interval
         if timeindex != "all":
@@ -454,34 +771,31 @@ def get_tab_urls(url_set,
                 continue
 
         # return url, file name, file size, and release
-        flnm.append(flnmi)
+        flnm.extend(flnmi)
         flpth.append(flpthi)
-        z.append(zi)
-        sz.append(flszi)
+        z.extend(zi)
+        sz.extend(flszi)
         rel.append(m_di["data"]["release"])
 
     # get most recent metadata files from lists
     try:
-        varf = sum(varf, [])
         varfl = get_recent(varf, "variables")
-        flnm.append([fl["name"] for fl in varfl])
-        z.append([fl["url"] for fl in varfl])
-        sz.append([fl["size"]for fl in varfl])
+        flnm.extend(fl["name"] for fl in varfl)
+        z.extend(fl["url"] for fl in varfl)
+        sz.extend(fl["size"] for fl in varfl)
     except Exception:
         pass
 
     try:
-        rdme = sum(rdme, [])
         rdfl = get_recent(rdme, "readme")
-        flnm.append([fl["name"] for fl in rdfl])
-        z.append([fl["url"] for fl in rdfl])
-        sz.append([fl["size"] for fl in rdfl])
+        flnm.extend(fl["name"] for fl in rdfl)
+        z.extend(fl["url"] for fl in rdfl)
+        sz.extend(fl["size"] for fl in rdfl)
     except Exception:
         pass
 
     # get most recent sensor positions file for each site
     if len(sp) > 0:
-        sp = sum(sp, [])
         sr = re.compile("[/][A-Z]{4}[/]")
         sites = [sr.search(f["url"]).group(0) for f in sp]
         sites = list(set(sites))
@@ -489,15 +803,12 @@ def get_tab_urls(url_set,
         try:
             for s in sites:
                 spfl = get_recent(sp, s)
-                flnm.append([fl["name"] for fl in spfl])
-                z.append([fl["url"] for fl in spfl])
-                sz.append([fl["size"] for fl in spfl])
+                flnm.extend(fl["name"] for fl in spfl)
+                z.extend(fl["url"] for fl in spfl)
+                sz.extend(fl["size"] for fl in spfl)
         except Exception:
             pass
 
-    z = sum(z, [])
-    flnm = sum(flnm, [])
-    sz = sum(sz, [])
     tbfiles = dict(flnm=flnm, flpth=flpth, z=z, sz=sz, rel=rel)
 
     # provisional message
@@ -510,7 +821,8 @@ def get_tab_urls(url_set,
 def download_urls(url_set, 
                   outpath,
                   token=None,
-                  progress=True):
+                  progress=True,
+                  max_workers=8):
     """
 
     Given a set of urls to NEON data packages or files, downloads the contents of each. Internal function, called by zips_by_product().
@@ -521,6 +833,7 @@ def download_urls(url_set,
     outpath: Filepath of the folder to download to
     token: User specific API token (generated within neon.datascience user accounts). Optional.
     progress: Should the progress bar be displayed?
+    max_workers: Maximum number of files to download at the same time. Defaults to 8.
 
     Return
     --------
@@ -531,63 +844,86 @@ def download_urls(url_set,
     @author: Claire Lunch
     """
 
-    if progress:
-        logging.info("Downloading files")
+    # check all the file paths before starting any downloads
+    if platform.system() == "Windows":
+        for flnm in url_set["flnm"]:
+            if len(os.path.join(outpath, flnm)) > 260:
+                raise OSError(
+                    f'Filepath is {len(os.path.join(outpath, flnm))} characters long. Filepaths on Windows are limited to 260 characters. Move your working directory closer to the root directory or enable long path support in Windows through the Registry Editor.')
 
-    for i in tqdm(range(0, len(url_set["z"])), disable=not progress):
+    os.makedirs(outpath, exist_ok=True)
 
-        if len(outpath+url_set["flnm"][i]) > 260 and platform.system() == "Windows":
-            raise OSError(
-                f'Filepath is {len(outpath+url_set["flnm"][i])} characters long. Filepaths on Windows are limited to 260 characters. Move your working directory closer to the root directory or enable long path support in Windows through the Registry Editor.')
-            return
+    if progress:
+        logging.info("Downloading files")
 
-        else:
+    # Construct headers either with or without token. The files are
+    # downloaded with the shared session, which keeps the connection alive
+    # between files, and streamed to disk in 1 MB chunks rather than held in
+    # memory whole.
+    if token is None:
+        headers = {"accept": "application/json"}
+    else:
+        headers = {"X-API-TOKEN": token,
+                   "accept": "application/json"}
+
+    def download_url(url, flnm):
+        # Make 3 download attempts. Rate-limited and unavailable responses
+        # are retried by the session; this retries dropped connections and
+        # interrupted transfers, after a random wait of up to 1, then 2
+        # seconds, as in download_file(). Other error responses (e.g. 404)
+        # and file errors won't be fixed by trying again.
+        for attempt in range(3):
             try:
-                if token is None:
-                    j = 0
-                    while j < 3:
-                        try:
-                            with open(outpath+url_set["flnm"][i], "wb") as out_file:
-                                content = requests.get(url_set["z"][i], stream=True,
-                                                       headers={"accept": "application/json",
-                                                                "User-Agent": usera},
-                                                       timeout=(10, 120)).content
-                                out_file.write(content)
-                            j = j+5
-                        except Exception as e:
-                            logging.info(
-                                f"File {url_set['flnm'][i]} could not be downloaded. Re-attempting.")
-                            print(e)
-                            j = j+1
-                            time.sleep(5)
-                else:
-                    j = 0
-                    while j < 3:
-                        try:
-                            with open(outpath+url_set["flnm"][i], "wb") as out_file:
-                                content = requests.get(url_set["z"][i], stream=True,
-                                                       headers={"X-API-TOKEN": token,
-                                                                "accept": "application/json",
-                                                                "User-Agent": usera},
-                                                       timeout=(10, 120)).content
-                                out_file.write(content)
-                            j = j+5
-                        except Exception as e:
-                            logging.info(
-                                f"File {url_set['flnm'][i]} could not be downloaded. Re-attempting.")
-                            print(e)
-                            j = j+1
-                            time.sleep(5)
-
-            except Exception:
+                # zip packages come from the API, so share its rate limit
+                if "data.neonscience.org/api/" in url:
+                    limiter.acquire()
+                with get_session().get(url, stream=True, headers=headers,
+                                       timeout=(10, 120)) as r:
+                    # don't write an error response to disk as the zip file
+                    r.raise_for_status()
+                    with open(os.path.join(outpath, flnm), "wb") as out_file:
+                        for chunk in r.iter_content(chunk_size=1048576):
+                            out_file.write(chunk)
+                return
+
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == 2:
+                    logging.info(
+                        f"File {flnm} could not be downloaded ({e!r}).")
+                    break
+                logging.info(
+                    f"File {flnm} could not be downloaded ({e!r}). Re-attempting.")
+                time.sleep(random.uniform(0, min(60, 2**attempt)))
+
+            except (requests.RequestException, OSError) as e:
                 logging.info(
-                    f"File {url_set['flnm'][i]} could not be downloaded and was skipped. If this issue persists, check your network connection and check the NEON Data Portal for outage alerts.")
-                pass
+                    f"File {flnm} could not be downloaded ({e!r}).")
+                break
+
+        # don't leave a truncated zip file behind for the stacking step
+        try:
+            os.remove(os.path.join(outpath, flnm))
+        except OSError:
+            pass
+
+        logging.info(
+            f"File {flnm} could not be downloaded and was skipped. If this issue persists, check your network connection and check the NEON Data Portal for outage alerts.")
+
+    # download the files in parallel; the API rate limit is respected by the
+    # shared rate limiter
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(download_url, url, flnm)
+                   for url, flnm in zip(url_set["z"], url_set["flnm"])]
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           disable=not progress):
+            future.result()
 
     return None
 
 
-def download_file(url, savepath, chunk_size=1024, token=None):
+def download_file(url, savepath, chunk_size=1048576, token=None, size=None,
+                  progress=None):
     """
     This function downloads a single file from a Google Cloud Storage URL to a user-specified directory.
 
@@ -599,12 +935,18 @@ def download_file(url, savepath, chunk_size=1024, token=None):
     savepath: str
         The file location (path) where the file will be downloaded.
 
-    chunk_size: 
-        Size in bytes of chunks for chunked download
+    chunk_size: int, optional
+        Size in bytes of chunks for chunked download. Defaults to 1048576 (1 MB).
 
     token: str, optional
         User-specific API token generated within neon.datascience user accounts. If provided, it will be used for authentication.
 
+    size: int, optional
+        The expected size of the file in bytes. If provided, a file that has already been downloaded completely is skipped, and a partially downloaded file is resumed.
+
+    progress: callable, optional
+        A function called with the number of bytes of the file newly on disk, e.g. the update method of a tqdm progress bar in bytes. Bytes already on disk from an earlier download are counted too.
+
     Returns
     --------
     None
@@ -621,6 +963,7 @@ def download_file(url, savepath, chunk_size=1024, token=None):
     Notes
     --------
     The function creates the directory specified by 'savepath' if it does not exist. 
+    Downloads use the shared session, so connections to the storage host are kept alive and reused between files.
     It also downloads the readme.txt file which contains detailed information about the data package, issue logs, etc.
     https://storage.googleapis.com/neon-publication/NEON.DOM.SITE.DP3.30015.001/SCBI/20230601T000000--20230701T000000/basic/NEON.D02.SCBI.DP3.30015.001.readme.20240206T001418Z.txt
     
@@ -630,8 +973,8 @@ def download_file(url, savepath, chunk_size=1024, token=None):
 
     """
 
-    pathparts = url.split("/")
-    file_path = "/".join(pathparts[3:len(pathparts)])
+    # keep the path after the host, e.g. neon-aop-products/2023/.../file.tif
+    file_path = url.split("/", 3)[-1]
 
     file_fullpath = savepath + "/" + file_path
     file_fullpath_abs = os.path.abspath(file_fullpath)  # get the absolute path
@@ -644,47 +987,82 @@ def download_file(url, savepath, chunk_size=1024, token=None):
     else:
         os.makedirs(os.path.dirname(file_fullpath), exist_ok=True)
 
-        try:
-            if token is None:
-                j = 0
-                while j < 3:
-                    try:
-                        r = requests.get(url, stream=True,
-                                         headers={"accept": "application/json",
-                                                  "User-Agent": usera},
-                                         timeout=(10, 120))
-                        j = j+5
-                    except Exception:
-                        logging.info(
-                            f"File {os.path.basename(url)} could not be downloaded. Re-attempting.")
-                        j = j+1
-                        time.sleep(5)
+        # Construct headers either with or without token
+        if token is None:
+            headers = {"accept": "application/json"}
+        else:
+            headers = {"X-API-TOKEN": token,
+                       "accept": "application/json"}
+
+        # Make 5 download attempts. Rate-limited and unavailable responses
+        # are retried by the session; this retries dropped connections and
+        # interrupted transfers, after a random wait of up to 1, 2, 4, 8
+        # seconds (full jitter), so parallel downloads don't retry in step.
+        # bytes of this file reported to progress so far; progress is only
+        # given the increase, so data written again on a retry isn't counted
+        # twice
+        reported = 0
+
+        def report(position):
+            nonlocal reported
+            if progress is not None and position > reported:
+                progress(position - reported)
+                reported = position
+
+        for attempt in range(5):
+
+            # If the expected size is known, skip a file that is already
+            # complete, and request only the rest of a partial file
+            existing = 0
+            if size is not None and os.path.exists(file_fullpath):
+                existing = os.path.getsize(file_fullpath)
+                if existing == size:
+                    report(size)
+                    return
+                if existing > size:
+                    existing = 0
+            if existing > 0:
+                range_headers = dict(headers, Range=f"bytes={existing}-")
             else:
-                j = 0
-                while j < 3:
-                    try:
-                        r = requests.get(url, stream=True,
-                                         headers={"X-API-TOKEN": token,
-                                                  "accept": "application/json",
-                                                  "User-Agent": usera},
-                                         timeout=(10, 120))
-                        j = j+5
-                    except Exception:
-                        logging.info(
-                            f"File {os.path.basename(url)} could not be downloaded. Re-attempting.")
-                        j = j+1
-                        time.sleep(5)
-
-            with open(file_fullpath, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        f.write(chunk)
-            r.close()
-
-        except Exception as e:
-            logging.info(f"File {os.path.basename(url)} could not be downloaded and was skipped or partially downloaded. If this issue persists, check your network connection and check the NEON Data Portal for outage alerts.")
-            # print(e)
-            pass
+                range_headers = headers
+
+            try:
+                with get_session().get(url, stream=True,
+                                       headers=range_headers,
+                                       timeout=(10, 120)) as r:
+                    # a range the server can't satisfy means the partial
+                    # file doesn't match; start over
+                    if r.status_code == 416:
+                        os.remove(file_fullpath)
+                        continue
+                    r.raise_for_status()
+                    # the server sends the whole file (200) if it doesn't
+                    # support ranges, so only append to a partial response
+                    if r.status_code == 206:
+                        mode, position = 'ab', existing
+                    else:
+                        mode, position = 'wb', 0
+                    report(position)
+                    with open(file_fullpath, mode) as f:
+                        for chunk in r.iter_content(chunk_size=chunk_size):
+                            f.write(chunk)
+                            position += len(chunk)
+                            report(position)
+                return
+
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError):
+                if attempt == 4:
+                    break
+                logging.info(
+                    f"File {os.path.basename(url)} could not be downloaded. Re-attempting.")
+                time.sleep(random.uniform(0, min(60, 2**attempt)))
+
+            except (requests.RequestException, OSError) as e:
+                logging.info(f"File {os.path.basename(url)} could not be downloaded ({e!r}).")
+                break
+
+        logging.info(f"File {os.path.basename(url)} could not be downloaded and was skipped or partially downloaded. If this issue persists, check your network connection and check the NEON Data Portal for outage alerts.")
 
         return
 
@@ -709,7 +1087,7 @@ def readme_url(readmepath):
 
     rdres = requests.get(readmepath, 
                          headers={"accept": "application/json",
-                                  "User-Agent": usera})
+                                  "User-Agent": get_user_agent()})
     rdtxt = rdres.text
     rdlst = rdtxt.split("\n")
     rdfrm = pd.DataFrame(rdlst)
@@ -47,10 +47,19 @@ def get_recent(fl_set, fltype):
     return [flmax[0]]
 
 
+# divisor, unit, and decimal places for each power of 1000 bytes
+byte_units = ((1, 'B', None),
+              (10**3, 'KB', 2),
+              (10**6, 'MB', 1),
+              (10**9, 'GB', 1),
+              (10**12, 'TB', 1),
+              (10**15, 'PB', 1))
+
+
 def convert_byte_size(size_bytes):
     """
     This function converts the file size in bytes to a more readable format.
-    It converts bytes to Kilobytes (KB), Megabytes (MB), Gigabytes (GB), or Terabytes (TB)
+    It converts bytes to Kilobytes (KB), Megabytes (MB), Gigabytes (GB), Terabytes (TB), or Petabytes (PB)
     depending on the size of the input.
 
     Parameters
@@ -62,7 +71,7 @@ def convert_byte_size(size_bytes):
     --------
     str
         A string that represents the file size in a more readable format.
-        The format includes the size number followed by the size unit (KB, MB, GB, or TB).
+        The format includes the size number followed by the size unit (B, KB, MB, GB, TB, or PB).
 
     Raises
     --------
@@ -70,6 +79,9 @@ def convert_byte_size(size_bytes):
 
     Examples
     --------
+    >>> convert_byte_size(500)
+    '500 B'
+
     >>> convert_byte_size(5000)
     '5.0 KB'
 
@@ -82,19 +94,9 @@ def convert_byte_size(size_bytes):
     >>> convert_byte_size(4000000000000)
     '4.0 TB'
 """
-    if 10**3 < size_bytes < 10**6:
-        size_kb = round(size_bytes/(10**3), 2)
-        size_read = f'{size_kb} KB'
-    elif 10**6 < size_bytes < 10**9:
-        size_mb = round(size_bytes/(10**6), 1)
-        size_read = f'{size_mb} MB'
-        # print('Download size:', size_read)
-    elif 10**9 < size_bytes < 10**12:
-        size_gb = round(size_bytes/(10**9), 1)
-        size_read = f'{size_gb} GB'
-        # print('Download size:', size_read)
-    else:
-        size_tb = round(size_bytes/(10**12), 1)
-        size_read = f'{size_tb} TB'
-        # print('Download size:', size_read)
+    # each power of 1000 has its divisor, unit, and number of decimals;
+    # the number of digits in the size picks the row
+    i = min(len(byte_units) - 1, (len(str(int(size_bytes))) - 1) // 3)
+    divisor, unit, digits = byte_units[i]
+    size_read = f'{round(size_bytes/divisor, digits)} {unit}'
     return size_read
@@ -7,6 +7,7 @@ import importlib_resources
 import pandas as pd
 import logging
 from .helper_mods.api_helpers import get_api
+from .helper_mods.api_helpers import parse_json
 from .helper_mods.api_helpers import get_zip_urls
 from .helper_mods.api_helpers import get_tab_urls
 from .helper_mods.api_helpers import download_urls
@@ -14,6 +15,12 @@ from .helper_mods.metadata_helpers import convert_byte_size
 from . import __resources__
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
+# regular expressions for validating inputs and reading dates from urls,
+# compiled once
+dpid_pattern = re.compile(r"DP[1-4]\.[0-9]{5}\.00[0-9]")
+date_pattern = re.compile("[0-9]{4}-[0-9]{2}")
+url_date_pattern = re.compile("20[0-9]{2}-[0-9]{2}")
+
 
 def query_files(lst, dpid, site="all", startdate=None, enddate=None,
                 package="basic", release="current",
@@ -101,7 +108,7 @@ def query_files(lst, dpid, site="all", startdate=None, enddate=None,
     if qreq is None:
         logging.info("No API response for selected query. Check inputs.")
         return None
-    qdict = qreq.json()
+    qdict = parse_json(qreq)
 
     # get file list from dictionary response
     reldict = qdict.get("data")
@@ -215,8 +222,7 @@ def zips_by_product(dpid, site="all", startdate=None, enddate=None,
     """
 
     # error message if dpid is not formatted correctly
-    if not re.search(pattern="DP[1-4]{1}.[0-9]{5}.00[0-9]{1}", 
-                     string=dpid):
+    if not dpid_pattern.search(dpid):
         raise ValueError(f"{dpid} is not a properly formatted data product ID. The correct format is DP#.#####.00#")
 
     # error message if package is not basic or expanded
@@ -257,11 +263,11 @@ def zips_by_product(dpid, site="all", startdate=None, enddate=None,
     # error message if dates aren't formatted correctly
     # separate logic for each, to easily allow only one to be NA
     if startdate is not None:
-        if re.search(pattern="[0-9]{4}-[0-9]{2}", string=startdate) is None:
+        if date_pattern.search(startdate) is None:
             raise ValueError("startdate and enddate must be either None or valid dates in the form YYYY-MM")
 
     if enddate is not None:
-        if re.search(pattern="[0-9]{4}-[0-9]{2}", string=enddate) is None:
+        if date_pattern.search(enddate) is None:
             raise ValueError("startdate and enddate must be either None or valid dates in the form YYYY-MM")
 
     # can only specify timeindex xor tabl
@@ -336,7 +342,7 @@ def zips_by_product(dpid, site="all", startdate=None, enddate=None,
                                token=token)
                 if rels is None:
                     raise ConnectionError("Data product was not found or API was unreachable.")
-                relj = rels.json()
+                relj = parse_json(rels)
                 reld = relj["data"]
                 rellist = []
                 for i in range(0, len(reld)):
@@ -348,7 +354,7 @@ def zips_by_product(dpid, site="all", startdate=None, enddate=None,
             else:
                 raise ConnectionError("Data product was not found or API was unreachable.")
         
-    avail = prodreq.json()
+    avail = parse_json(prodreq)
 
     # error message if product or data not found
     # I think this would never be called due to the way get_api() is set up
@@ -406,8 +412,7 @@ def zips_by_product(dpid, site="all", startdate=None, enddate=None,
 
         # subset by start date
         if startdate is not None:
-            ste = re.compile("20[0-9]{2}-[0-9]{2}")
-            start_urls = [st for st in site_urls if ste.search(st).group(0)>=startdate]
+            start_urls = [st for st in site_urls if url_date_pattern.search(st).group(0)>=startdate]
         else:
             start_urls = site_urls
             
@@ -418,8 +423,7 @@ def zips_by_product(dpid, site="all", startdate=None, enddate=None,
 
         # subset by end date
         if enddate is not None:
-            ete = re.compile("20[0-9]{2}-[0-9]{2}")
-            end_urls = [et for et in start_urls if ete.search(et).group(0)<=enddate]
+            end_urls = [et for et in start_urls if url_date_pattern.search(et).group(0)<=enddate]
         else:
             end_urls = start_urls
 
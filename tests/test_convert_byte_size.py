@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for convert_byte_size()
+
+These check the unit chosen at the edges of each power of 1000 bytes,
+including sizes beyond the largest unit (PB).
+
+Notes:
+- Paramaterization with the @parameterized.expand decorator allows for testing different sets of inputs with the same test
+    This requires the parameterized package (pip install parameterized)
+
+"""
+
+# import required packages
+import unittest
+from parameterized import parameterized
+
+from src.neonutilities.helper_mods.metadata_helpers import convert_byte_size
+
+
+class TestConvertByteSize(unittest.TestCase):
+    @parameterized.expand([
+        (0, "0 B"),
+        (999, "999 B"),
+        (1000, "1.0 KB"),
+        (1500, "1.5 KB"),
+        (10**6, "1.0 MB"),
+        (10**15, "1.0 PB"),
+        (2.5 * 10**15, "2.5 PB"),
+        (10**18, "1000.0 PB"),
+        (10**21, "1000000.0 PB"),
+    ])
+    def test_convert_byte_size(self, size_bytes, expected):
+        self.assertEqual(convert_byte_size(size_bytes), expected)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for download_file()
+
+These test resuming partial downloads, restarting when the server can't
+satisfy the requested range, skipping files that are already complete, and
+progress reporting.
+
+Notes:
+- These tests don't need an internet connection; files are served by a
+  local http.server
+- Paramaterization with the @parameterized.expand decorator allows for testing different sets of inputs with the same test
+    This requires the parameterized package (pip install parameterized)
+
+"""
+
+# import required packages
+import os
+import re
+import shutil
+import tempfile
+import threading
+import http.server
+import unittest
+from parameterized import parameterized
+
+from src.neonutilities.helper_mods.api_helpers import download_file
+
+# contents of the file served by the local server
+content = bytes(range(256)) * 40
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves content, honouring Range requests. Paths containing "norange"
+    ignore the Range header, and paths containing "stale" refuse it with 416.
+    """
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        self.requests.append((self.path, range_header))
+        start = 0
+        if range_header is not None and "norange" not in self.path:
+            start = int(re.match(r"bytes=(\d+)-", range_header).group(1))
+        if start and "stale" in self.path:
+            self.send_response(416)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = content[start:]
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloadFile(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0),
+                                                     RangeHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.savepath = tempfile.mkdtemp()
+        RangeHandler.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.savepath)
+
+    def write_partial(self, path, data):
+        # write data to the file download_file() would save path to
+        file_fullpath = os.path.join(self.savepath, path.lstrip("/"))
+        os.makedirs(os.path.dirname(file_fullpath), exist_ok=True)
+        with open(file_fullpath, "wb") as f:
+            f.write(data)
+
+    def download(self, path):
+        # download path with its size known, and check the file contents
+        # and that the progress reported adds up to the file size
+        updates = []
+        download_file(self.url + path, self.savepath, chunk_size=1000,
+                      size=len(content), progress=updates.append)
+        with open(os.path.join(self.savepath, path.lstrip("/")), "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(sum(updates), len(content))
+
+    def test_download_file_new(self):
+        self.download("/bucket/new.tif")
+        self.assertEqual(RangeHandler.requests, [("/bucket/new.tif", None)])
+
+    @parameterized.expand([
+        # partial file is resumed from where it stopped
+        ("/bucket/part.tif", content[:3000],
+         [("/bucket/part.tif", "bytes=3000-")]),
+        # the server ignores the range and sends the whole file, which is
+        # written from scratch
+        ("/bucket/norange.tif", content[:3000],
+         [("/bucket/norange.tif", "bytes=3000-")]),
+        # the server can't resume the partial file (416), so it is removed
+        # and the download restarted
+        ("/bucket/stale.tif", b"x" * 3000,
+         [("/bucket/stale.tif", "bytes=3000-"), ("/bucket/stale.tif", None)]),
+        # a complete file isn't downloaded again
+        ("/bucket/done.tif", content, []),
+    ])
+    def test_download_file_existing(self, path, existing, expected_requests):
+        self.write_partial(path, existing)
+        self.download(path)
+        self.assertEqual(RangeHandler.requests, expected_requests)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for get_session()
+
+These check that the shared session still works when the requests-cache
+database can't be created or opened.
+
+Notes:
+- These tests are skipped if requests-cache isn't installed
+- These tests don't need an internet connection
+
+"""
+
+# import required packages
+import os
+import shutil
+import tempfile
+import unittest
+import importlib.util
+from unittest.mock import patch
+
+import requests
+
+import src.neonutilities.helper_mods.api_helpers as api_helpers
+
+
+@unittest.skipUnless(importlib.util.find_spec("requests_cache"),
+                     "requests-cache is not installed")
+class TestGetSession(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_uncached_session(self, cache_path):
+        with patch.object(api_helpers, "session", None), \
+                patch.object(api_helpers, "http_cache_path", cache_path):
+            with self.assertWarns(UserWarning):
+                session = api_helpers.get_session()
+            # a plain session, set up like the cached one
+            self.assertIs(type(session), requests.Session)
+            self.assertIn("neonutilities/",
+                          session.headers["User-Agent"])
+            self.assertIs(api_helpers.get_session(), session)
+
+    def test_cache_path_unwritable(self):
+        # the cache's parent directory is a regular file, so it can't be
+        # created, even with root permissions
+        blocker = os.path.join(self.tmpdir, "file")
+        with open(blocker, "w") as f:
+            f.write("")
+        self.check_uncached_session(os.path.join(blocker, "http_cache"))
+
+    def test_cache_corrupt(self):
+        with open(os.path.join(self.tmpdir, "http_cache.sqlite"), "wb") as f:
+            f.write(b"not a database" * 500)
+        self.check_uncached_session(os.path.join(self.tmpdir, "http_cache"))